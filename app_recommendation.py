@@ -126,6 +126,13 @@ except ImportError as e:
     combine_hybrid_scores = None
     _hybrid_utils_import_error = str(e)
 
+_step_results_import_error = None
+try:
+    from apps.utils.step_results_manager import get_step_results_manager
+except ImportError as e:
+    get_step_results_manager = None
+    _step_results_import_error = str(e)
+
 st.set_page_config(
     page_title="Fashion Recommendation System",
     page_icon="👔",
@@ -205,8 +212,28 @@ def _ensure_artifacts_dir() -> Path:
     return ARTIFACTS_DIR
 
 
+def _step_results_for(path: Path):
+    """Trả về (manager, step_key) nếu file thuộc một bước của StepResultsManager."""
+    if get_step_results_manager is None:
+        return None, None
+    manager = get_step_results_manager(path.parent)
+    return manager, manager.step_key_for_filename(path.name)
+
+
+def _artifact_exists(path: Path) -> bool:
+    """Kiểm tra artifact đã lưu chưa, kể cả khi StepResultsManager lưu bằng định dạng khác."""
+    manager, step_key = _step_results_for(path)
+    if step_key is not None:
+        return manager.get_step_file(step_key) is not None
+    return path.exists()
+
+
 def _load_pickle_if_exists(path: Path):
     """Load pickle nếu file tồn tại, ngược lại trả về None."""
+    manager, step_key = _step_results_for(path)
+    if step_key is not None:
+        # StepResultsManager có thể đã lưu bước này bằng định dạng khác (.pkl5, .feather...)
+        return manager.load_step_result(step_key)
     if not path.exists():
         return None
     try:
@@ -380,7 +407,7 @@ def get_artifacts_status() -> Dict[str, bool]:
     
     for state_key, fname in all_mappings:
         path = base / fname
-        status[state_key] = path.exists()
+        status[state_key] = _artifact_exists(path)
     
     return status
 
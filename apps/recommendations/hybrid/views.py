@@ -18,6 +18,7 @@ from apps.products.mongo_serializers import ProductSerializer as MongoProductSer
 
 from apps.recommendations.common.exceptions import ModelNotTrainedError
 from apps.utils.hybrid_utils import combine_hybrid_scores
+from apps.utils.step_results_manager import get_step_results_manager
 from apps.utils.cbf_utils import get_allowed_genders
 from apps.utils.user_profile import INTERACTION_WEIGHTS
 
@@ -114,25 +115,21 @@ def load_cached_predictions() -> Dict:
     """Load cached predictions from artifacts directory (giống Streamlit)."""
     predictions = {}
     
+    # Các file predictions do StepResultsManager quản lý có thể được lưu bằng
+    # định dạng khác pickle thường, nên đọc qua manager thay vì pickle.load
+    manager = get_step_results_manager(ARTIFACTS_DIR)
+    
     # Load CBF predictions
-    cbf_path = ARTIFACTS_DIR / "streamlit_cbf_predictions.pkl"
-    if cbf_path.exists():
-        try:
-            with open(cbf_path, 'rb') as f:
-                predictions['cbf'] = pickle.load(f)
-        except Exception as e:
-            logger.warning(f"Could not load CBF predictions: {e}")
+    cbf_predictions = manager.load_step_result('cbf_predictions')
+    if cbf_predictions is not None:
+        predictions['cbf'] = cbf_predictions
     
     # Load GNN predictions (ưu tiên gnn_predictions, fallback gnn_training)
-    gnn_path = ARTIFACTS_DIR / "streamlit_gnn_predictions.pkl"
+    gnn_predictions = manager.load_step_result('gnn_predictions')
     gnn_training_path = ARTIFACTS_DIR / "streamlit_gnn_training.pkl"
     
-    if gnn_path.exists():
-        try:
-            with open(gnn_path, 'rb') as f:
-                predictions['gnn'] = pickle.load(f)
-        except Exception as e:
-            logger.warning(f"Could not load GNN predictions: {e}")
+    if gnn_predictions is not None:
+        predictions['gnn'] = gnn_predictions
     elif gnn_training_path.exists():
         # Fallback to gnn_training (giống Streamlit)
         try:
@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import types
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase
+
+from apps.utils import step_results_manager
+from apps.utils.step_results_manager import StepResultsManager, get_step_results_manager
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+
+class StepResultsManagerRoundTripTests(SimpleTestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.artifacts_dir = Path(self._tmp.name)
+        self.manager = StepResultsManager(self.artifacts_dir)
+
+    def tearDown(self):
+        self.manager._io_pool.shutdown(wait=True)
+        self._tmp.cleanup()
+
+    def test_dict_round_trip_does_not_touch_plain_pickle_file(self):
+        data = {"user_1": [("p1", 0.9), ("p2", 0.5)], "scores": np.arange(5, dtype=np.float32)}
+
+        self.assertTrue(self.manager.save_step_result("cbf_predictions", data))
+
+        loaded = self.manager.load_step_result("cbf_predictions")
+        self.assertEqual(loaded["user_1"], data["user_1"])
+        np.testing.assert_array_equal(loaded["scores"], data["scores"])
+        self.assertFalse((self.artifacts_dir / "streamlit_cbf_predictions.pkl").exists())
+        self.assertEqual(
+            self.manager.get_step_file("cbf_predictions"),
+            self.artifacts_dir / "streamlit_cbf_predictions.pkl5",
+        )
+
+    def test_loads_plain_pickle_written_by_other_code(self):
+        data = {"user_1": [("p1", 0.9)]}
+        with open(self.artifacts_dir / "streamlit_gnn_predictions.pkl", "wb") as f:
+            pickle.dump(data, f)
+
+        self.assertEqual(self.manager.load_step_result("gnn_predictions"), data)
+
+    def test_newer_plain_pickle_wins_over_older_saved_format(self):
+        self.assertTrue(self.manager.save_step_result("cbf_predictions", {"old": 1}))
+        saved = self.manager.get_step_file("cbf_predictions")
+
+        legacy_path = self.artifacts_dir / "streamlit_cbf_predictions.pkl"
+        with open(legacy_path, "wb") as f:
+            pickle.dump({"new": 2}, f)
+        newer_ns = saved.stat().st_mtime_ns + 1_000_000_000
+        os.utime(legacy_path, ns=(newer_ns, newer_ns))
+
+        self.assertEqual(self.manager.load_step_result("cbf_predictions"), {"new": 2})
+        # Lưu lại cùng dữ liệu cũ vẫn phải ghi đè bản pickle mới hơn
+        self.assertTrue(self.manager.save_step_result("cbf_predictions", {"old": 1}))
+        self.assertEqual(self.manager.load_step_result("cbf_predictions"), {"old": 1})
+        self.assertFalse(legacy_path.exists())
+
+    def test_ndarray_round_trip(self):
+        data = np.random.rand(4, 3).astype(np.float32)
+
+        self.assertTrue(self.manager.save_step_result("gnn_propagation", data))
+
+        loaded = self.manager.load_step_result("gnn_propagation")
+        np.testing.assert_array_equal(np.asarray(loaded), data)
+        self.assertEqual(self.manager.get_step_file("gnn_propagation").suffix, ".npy")
+
+    def test_loaded_ndarray_can_be_saved_again_as_npy(self):
+        data = np.arange(12, dtype=np.int64).reshape(3, 4)
+        self.assertTrue(self.manager.save_step_result("gnn_propagation", data))
+        loaded = self.manager.load_step_result("gnn_propagation")
+
+        self.assertTrue(self.manager.save_step_result("gnn_graph", loaded))
+
+        np.testing.assert_array_equal(np.asarray(self.manager.load_step_result("gnn_graph")), data)
+        self.assertEqual(self.manager.get_step_file("gnn_graph").suffix, ".npy")
+
+    def test_dataframe_round_trip(self):
+        data = pd.DataFrame({"user_id": ["u1", "u2"], "product_id": ["p1", "p2"], "weight": [1.0, 3.0]})
+
+        self.assertTrue(self.manager.save_step_result("pruned_interactions", data))
+
+        loaded = self.manager.load_step_result("pruned_interactions")
+        pd.testing.assert_frame_equal(loaded, data)
+        expected_suffix = ".feather" if pyarrow is not None else ".pkl5"
+        self.assertEqual(self.manager.get_step_file("pruned_interactions").suffix, expected_suffix)
+
+    def test_loaded_dataframe_is_writable(self):
+        data = pd.DataFrame({"user_id": ["u1", "u2"], "weight": [1.0, 3.0]})
+        self.assertTrue(self.manager.save_step_result("pruned_interactions", data))
+
+        loaded = self.manager.load_step_result("pruned_interactions")
+        loaded.loc[0, "weight"] = 9.0
+
+        self.assertEqual(loaded.loc[0, "weight"], 9.0)
+
+    def test_dataframe_with_list_columns_or_attrs_keeps_python_values(self):
+        data = pd.DataFrame({"user_id": ["u1", "u2"], "history": [["p1", "p2"], ["p3"]]})
+        data.attrs["source"] = "pruning"
+
+        self.assertTrue(self.manager.save_step_result("user_profiles", data))
+
+        loaded = self.manager.load_step_result("user_profiles")
+        self.assertEqual(loaded["history"].tolist(), [["p1", "p2"], ["p3"]])
+        self.assertEqual(loaded.attrs, {"source": "pruning"})
+        self.assertEqual(self.manager.get_step_file("user_profiles").suffix, ".pkl5")
+
+        # Cột object chứa số (kể cả lẫn None) mà Arrow sẽ đổi thành int64/float
+        data = pd.DataFrame({
+            "ids": pd.Series([1, 2, 3], dtype=object),
+            "mixed": pd.Series([1, None, 3], dtype=object),
+        })
+        self.assertTrue(self.manager.save_step_result("user_profiles", data))
+
+        loaded = self.manager.load_step_result("user_profiles")
+        self.assertEqual(loaded["ids"].tolist(), [1, 2, 3])
+        self.assertEqual(loaded["mixed"].tolist(), [1, None, 3])
+        self.assertEqual(loaded["ids"].dtype, object)
+        self.assertEqual(self.manager.get_step_file("user_profiles").suffix, ".pkl5")
+
+    def test_dataframe_with_new_index_name_is_saved_again(self):
+        data = pd.DataFrame({"weight": [1.0, 3.0]}, index=["u1", "u2"])
+        self.assertTrue(self.manager.save_step_result("pruned_interactions", data))
+
+        renamed = data.rename_axis("user_id")
+        self.assertTrue(self.manager.save_step_result("pruned_interactions", renamed))
+
+        self.assertEqual(self.manager.load_step_result("pruned_interactions").index.name, "user_id")
+
+    def test_tensor_round_trip(self):
+        if torch is None:
+            self.skipTest("torch is not installed")
+        data = torch.arange(6, dtype=torch.float32).reshape(2, 3)
+
+        self.assertTrue(self.manager.save_step_result("gnn_training", data))
+
+        self.assertTrue(torch.equal(self.manager.load_step_result("gnn_training"), data))
+        self.assertEqual(self.manager.get_step_file("gnn_training").suffix, ".pt")
+
+    def test_corrupt_file_is_skipped_until_it_changes(self):
+        bad_path = self.artifacts_dir / "gnn_graph.pkl"
+        bad_path.write_bytes(b"\x80\x05not a pickle")
+
+        self.assertIsNone(self.manager.load_step_result("gnn_graph"))
+        self.assertIn(bad_path, self.manager._bad_files)
+
+        self.assertTrue(self.manager.save_step_result("gnn_graph", {"edges": [(0, 1)]}))
+        self.assertEqual(self.manager.load_step_result("gnn_graph"), {"edges": [(0, 1)]})
+
+    def test_memo_keeps_one_entry_per_file(self):
+        with mock.patch.object(step_results_manager, "_in_streamlit_runtime", return_value=True):
+            self.assertTrue(self.manager.save_step_result("cbf_predictions", {"v": 1}))
+            first = self.manager.load_step_result("cbf_predictions")
+            self.assertIs(self.manager.load_step_result("cbf_predictions"), first)
+
+            self.assertTrue(self.manager.save_step_result("cbf_predictions", {"v": 2}))
+            self.assertEqual(self.manager.load_step_result("cbf_predictions"), {"v": 2})
+
+        self.assertEqual(len(self.manager._memo), 1)
+
+    def test_load_outside_streamlit_does_not_memoize(self):
+        self.assertTrue(self.manager.save_step_result("cbf_predictions", {"v": 1}))
+
+        self.assertEqual(self.manager.load_step_result("cbf_predictions"), {"v": 1})
+        self.assertEqual(self.manager._memo, {})
+
+
+class StepResultsManagerSessionTests(SimpleTestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.artifacts_dir = Path(self._tmp.name)
+        self.manager = StepResultsManager(self.artifacts_dir)
+        self.session_state = {}
+        patcher = mock.patch.dict(
+            sys.modules, {"streamlit": types.SimpleNamespace(session_state=self.session_state)}
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.manager._io_pool.shutdown(wait=True)
+        self._tmp.cleanup()
+
+    def test_background_write_is_visible_to_following_save_and_load(self):
+        self.assertTrue(self.manager.save_to_session_and_file("cbf_predictions", {"v": 1}))
+        self.assertEqual(self.session_state["cbf_predictions"], {"v": 1})
+        self.assertEqual(self.manager.load_step_result("cbf_predictions"), {"v": 1})
+
+        self.assertTrue(self.manager.save_to_session_and_file("cbf_predictions", {"v": 2}))
+        self.assertTrue(self.manager.save_step_result("cbf_predictions", {"v": 3}))
+
+        self.assertEqual(self.manager.load_step_result("cbf_predictions"), {"v": 3})
+
+    def test_restore_all_steps_loads_missing_steps_into_session(self):
+        self.assertTrue(self.manager.save_step_result("cbf_predictions", {"v": 1}))
+        self.assertTrue(self.manager.save_step_result("gnn_propagation", np.arange(4)))
+        self.session_state["gnn_graph"] = {"edges": []}
+
+        results = self.manager.restore_all_steps()
+
+        self.assertTrue(results["cbf_predictions"])
+        self.assertTrue(results["gnn_propagation"])
+        self.assertTrue(results["gnn_graph"])
+        self.assertFalse(results["pruned_interactions"])
+        self.assertEqual(self.session_state["cbf_predictions"], {"v": 1})
+        np.testing.assert_array_equal(np.asarray(self.session_state["gnn_propagation"]), np.arange(4))
+        self.assertNotIn("pruned_interactions", self.session_state)
+
+    def test_clear_all_steps_when_directory_was_deleted(self):
+        self.assertTrue(self.manager.save_step_result("cbf_predictions", {"v": 1}))
+        self.session_state["cbf_predictions"] = {"v": 1}
+        shutil.rmtree(self.artifacts_dir)
+
+        results = self.manager.clear_all_steps(clear_files=True)
+
+        self.assertTrue(all(results.values()))
+        self.assertNotIn("cbf_predictions", self.session_state)
+
+    def test_get_step_status_reports_newest_file(self):
+        self.assertTrue(self.manager.save_step_result("gnn_graph", {"edges": []}))
+        self.session_state["cbf_predictions"] = {"v": 1}
+
+        status = self.manager.get_step_status()
+
+        self.assertTrue(status["gnn_graph"]["in_file"])
+        self.assertEqual(status["gnn_graph"]["file_path"], str(self.manager.get_step_file("gnn_graph")))
+        self.assertFalse(status["cbf_predictions"]["in_file"])
+        self.assertTrue(status["cbf_predictions"]["in_session"])
+
+
+class StepResultsManagerRegistryTests(SimpleTestCase):
+
+    def test_equivalent_paths_share_one_manager(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cwd = os.getcwd()
+            os.chdir(tmp)
+            try:
+                manager = get_step_results_manager("x")
+                self.assertIs(get_step_results_manager(Path("./x")), manager)
+                self.assertIs(get_step_results_manager(os.path.join(tmp, "x")), manager)
+                self.assertIsNot(get_step_results_manager("y"), manager)
+            finally:
+                os.chdir(cwd)
@@ -4,11 +4,412 @@ Step Results Manager - Quản lý lưu trữ và khôi phục kết quả của
 Module này đảm bảo không mất dữ liệu khi người dùng chuyển giữa các bước trong ứng dụng Streamlit.
 """
 
+import atexit
+import gc
+import hashlib
+import logging
+import os
 import pickle
-import streamlit as st
+import struct
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Dict, List, Optional
-import pandas as pd
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple, Union
+
+# streamlit/pandas/pyarrow/zstandard chỉ được import khi thật sự cần, để các module
+# chỉ dùng API file (save_step_result/load_step_result) không phải trả chi phí import
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+
+# Protocol 5 (PEP 574) cho phép tách các buffer NumPy ra ngoài luồng pickle
+PICKLE_PROTOCOL = 5
+
+# Magic bytes đánh dấu file pickle protocol 5 có out-of-band buffers;
+# file pickle cũ (bắt đầu bằng b"\x80") vẫn được đọc như trước
+_OOB_MAGIC = b"SRM5"
+_LEN_FORMAT = "<Q"
+_LEN_SIZE = struct.calcsize(_LEN_FORMAT)
+
+# File Feather V2 / Arrow IPC bắt đầu bằng magic này. Không nén để khi đọc
+# có thể memory-map và dùng trực tiếp các cột số mà không sao chép
+_ARROW_MAGIC = b"ARROW1"
+FEATHER_COMPRESSION = "uncompressed"
+
+# Mảng numpy được lưu bằng np.save (.npy) và tensor bằng torch.save (zip)
+_NPY_MAGIC = b"\x93NUMPY"
+_TORCH_ZIP_MAGIC = b"PK\x03\x04"
+
+# Trên Windows file đang được memory-map không thể bị os.replace/unlink, nên lưu lại
+# hay xóa một bước đang được map sẽ lỗi; khi đó Feather/.npy được đọc hẳn vào bộ nhớ
+USE_MMAP = os.name != 'nt'
+
+# Frame zstd bắt đầu bằng magic này; mức 3 nén nhanh mà vẫn giảm đáng kể kích thước
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_ZSTD_FRAME_HEADER_MAX = 18
+ZSTD_LEVEL = 3
+
+# Unpickle file lớn hơn ngưỡng này thì tạm tắt GC: hàng triệu object tạm được
+# tạo ra sẽ kích hoạt GC quét lặp đi lặp lại mà không thu hồi được gì
+GC_PAUSE_MIN_BYTES = 10 << 20
+
+# Lỗi khi đọc một artifact hỏng hoặc bị cắt cụt; file gặp các lỗi này bị bỏ qua
+# cho tới khi thay đổi. Lỗi giải mã của từng định dạng được đổi thành
+# UnpicklingError ngay tại chỗ giải mã, để lỗi lập trình không bị nuốt mất
+_LOAD_ERRORS = (pickle.UnpicklingError, EOFError, OSError)
+
+# Lỗi mà pickle.loads/np.load/torch.load có thể báo khi dữ liệu hỏng
+# (class không còn tồn tại, opcode sai, header không hợp lệ...)
+_DECODE_ERRORS = (AttributeError, ImportError, IndexError, KeyError, TypeError, ValueError, struct.error)
+
+# Mỗi định dạng có đuôi file riêng, ghép với tên gốc (bỏ .pkl) trong STEP_MAPPINGS.
+# ".pkl" là pickle thường do code khác (app_recommendation) ghi và đọc bằng pickle.load;
+# manager không bao giờ ghi định dạng mới vào file .pkl. Khi có nhiều biến thể của
+# cùng một bước, file mới nhất được dùng.
+LEGACY_SUFFIX = '.pkl'
+PICKLE_SUFFIX = '.pkl5'
+FEATHER_SUFFIX = '.feather'
+NPY_SUFFIX = '.npy'
+TORCH_SUFFIX = '.pt'
+_STEP_SUFFIXES = (LEGACY_SUFFIX, PICKLE_SUFFIX, FEATHER_SUFFIX, NPY_SUFFIX, TORCH_SUFFIX)
+
+# Số luồng đọc file song song khi khôi phục tất cả các bước
+RESTORE_WORKERS = 8
+
+
+def _pickle_oob(data: Any) -> Tuple[bytes, List[memoryview], int]:
+    """
+    Pickle dữ liệu bằng protocol 5, tách các buffer lớn ra ngoài payload.
+    
+    Returns:
+        (payload, các buffer, tổng số byte mà _dump_pickle sẽ ghi)
+    """
+    buffers: List[pickle.PickleBuffer] = []
+    payload = pickle.dumps(data, protocol=PICKLE_PROTOCOL, buffer_callback=buffers.append)
+    raws = [buf.raw() for buf in buffers]
+    size = len(_OOB_MAGIC) + 4 + sum(_LEN_SIZE + raw.nbytes for raw in raws) + len(payload)
+    return payload, raws, size
+
+
+def _dump_pickle(payload: bytes, raws: List[memoryview], f) -> None:
+    """
+    Ghi kết quả của _pickle_oob, các buffer lớn được ghi thẳng ra file.
+    
+    Định dạng: magic | số buffer | (độ dài + nội dung) từng buffer | payload pickle
+    """
+    f.write(_OOB_MAGIC)
+    f.write(struct.pack("<I", len(raws)))
+    for raw in raws:
+        f.write(struct.pack(_LEN_FORMAT, raw.nbytes))
+        f.write(raw)
+    f.write(payload)
+
+
+def _read_exact(f, size: int) -> bytearray:
+    """
+    Đọc đúng size byte (luồng giải nén có thể trả về ít hơn mỗi lần đọc).
+    """
+    buf = bytearray(size)
+    view = memoryview(buf)
+    pos = 0
+    while pos < size:
+        n = f.readinto(view[pos:])
+        if not n:
+            raise EOFError("Artifact file is truncated")
+        pos += n
+    return buf
+
+
+def _unpickle(payload: bytes, buffers: Optional[List[pickle.PickleBuffer]] = None) -> Any:
+    """
+    pickle.loads, báo mọi lỗi giải mã bằng UnpicklingError.
+    """
+    try:
+        return pickle.loads(payload, buffers=buffers)
+    except _DECODE_ERRORS as e:
+        raise pickle.UnpicklingError(f"Cannot unpickle artifact: {e!r}") from e
+
+
+def _load_pickle(f) -> Any:
+    """
+    Đọc dữ liệu đã ghi bởi _dump_pickle, hoặc file pickle thông thường.
+    """
+    head = f.read(len(_OOB_MAGIC))
+    if head != _OOB_MAGIC:
+        return _unpickle(head + f.read())
+    
+    (count,) = struct.unpack("<I", _read_exact(f, 4))
+    buffers = []
+    for _ in range(count):
+        (size,) = struct.unpack(_LEN_FORMAT, _read_exact(f, _LEN_SIZE))
+        buffers.append(pickle.PickleBuffer(_read_exact(f, size)))
+    return _unpickle(f.read(), buffers)
+
+
+def _write_pickle_file(data: Any, filepath: Path) -> str:
+    """
+    Ghi dữ liệu bằng pickle, nén qua luồng zstd nếu có thư viện zstandard.
+    """
+    try:
+        import zstandard
+    except ImportError:  # zstandard không có thì pickle được ghi không nén
+        zstandard = None
+    
+    payload, raws, size = _pickle_oob(data)
+    with open(filepath, 'wb') as raw:
+        if zstandard is None:
+            _dump_pickle(payload, raws, raw)
+            return PICKLE_SUFFIX
+        # Ghi kích thước gốc vào header của frame để khi đọc biết dữ liệu lớn cỡ nào
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=-1)
+        with compressor.stream_writer(raw, size=size, closefd=False) as f:
+            _dump_pickle(payload, raws, f)
+    return PICKLE_SUFFIX
+
+
+def _is_text_type(pa, arrow_type) -> bool:
+    """
+    Kiểu Arrow đọc lại thành đúng cột object chuỗi/bytes ban đầu.
+    """
+    return (
+        pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type)
+        or pa.types.is_binary(arrow_type) or pa.types.is_large_binary(arrow_type)
+    )
+
+
+def _dump_feather(data: "pd.DataFrame", filepath: Path) -> Optional[str]:
+    """
+    Ghi DataFrame dưới dạng Feather (Arrow IPC).
+    
+    Chỉ ghi khi đọc lại được đúng như cũ: DataFrame không có attrs (Feather bỏ
+    attrs) và mọi cột object chỉ chứa chuỗi hoặc bytes. Cột object chứa số sẽ
+    được đọc lại thành int64/float64 (None thành NaN), cột chứa list/dict thành
+    mảng numpy, nên các cột đó được lưu bằng pickle.
+    
+    Returns:
+        FEATHER_SUFFIX, hoặc None nếu pyarrow không có hoặc DataFrame không biểu
+        diễn được bằng Arrow (index không mặc định, tên cột không phải str...)
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.feather as feather
+    except ImportError:  # pyarrow không có thì DataFrame được lưu bằng pickle
+        return None
+    if data.attrs:
+        return None
+    try:
+        for _, column in data.items():
+            if column.dtype == object and not _is_text_type(pa, pa.infer_type(column, from_pandas=True)):
+                return None
+        feather.write_feather(data, str(filepath), compression=FEATHER_COMPRESSION)
+        return FEATHER_SUFFIX
+    except (pa.ArrowException, ValueError, TypeError):
+        return None
+
+
+def _read_feather(filepath: Path) -> "pd.DataFrame":
+    """
+    Đọc file Feather qua memory map (đọc hẳn vào bộ nhớ nếu USE_MMAP tắt).
+    
+    Arrow đọc thẳng từ vùng nhớ map mà không cần buffer đọc trung gian; khi
+    chuyển sang pandas các cột được ghép block (sao chép một lần) để DataFrame
+    trả về ghi được như DataFrame đọc từ pickle.
+    """
+    import pyarrow as pa
+    
+    try:
+        if USE_MMAP:
+            table = pa.ipc.open_file(pa.memory_map(str(filepath), 'r')).read_all()
+        else:
+            with pa.OSFile(str(filepath), 'rb') as source:
+                table = pa.ipc.open_file(source).read_all()
+    except pa.ArrowException as e:
+        raise pickle.UnpicklingError(f"Invalid Feather artifact: {e}") from e
+    return table.to_pandas()
+
+
+@contextmanager
+def _gc_paused(size: int):
+    """
+    Tắt cyclic GC trong lúc unpickle dữ liệu lớn, bật lại nếu trước đó đang bật.
+    
+    Khi nhiều luồng cùng đọc, luồng nào thấy GC đang bật sẽ bật lại khi xong,
+    nên GC không bao giờ bị tắt luôn.
+    """
+    was_enabled = gc.isenabled()
+    if size > GC_PAUSE_MIN_BYTES:
+        gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+def _read_artifact(filepath: Path) -> Any:
+    """
+    Đọc một artifact, tự nhận dạng định dạng qua magic bytes: Feather, .npy,
+    torch, pickle nén zstd hay pickle thường.
+    """
+    with open(filepath, 'rb') as f:
+        head = f.read(len(_ARROW_MAGIC))
+        f.seek(0)
+        if head == _NPY_MAGIC:
+            import numpy as np
+            try:
+                # copy-on-write: trang được nạp khi truy cập, ghi vào mảng không đổi file
+                return np.load(filepath, mmap_mode='c' if USE_MMAP else None, allow_pickle=False)
+            except _DECODE_ERRORS as e:
+                raise pickle.UnpicklingError(f"Invalid .npy artifact: {e}") from e
+        if head.startswith(_TORCH_ZIP_MAGIC):
+            import torch
+            try:
+                return torch.load(filepath, map_location='cpu', weights_only=True)
+            except RuntimeError as e:  # torch.load báo file zip hỏng bằng RuntimeError
+                raise pickle.UnpicklingError(f"Invalid torch artifact: {e}") from e
+        if head.startswith(_ZSTD_MAGIC):
+            import zstandard
+            try:
+                # Ngưỡng tắt GC tính theo kích thước sau giải nén; file cũ không ghi
+                # kích thước này trong header thì dùng kích thước file
+                content_size = zstandard.frame_content_size(f.read(_ZSTD_FRAME_HEADER_MAX))
+                if content_size < 0:
+                    content_size = os.fstat(f.fileno()).st_size
+                f.seek(0)
+                with zstandard.ZstdDecompressor().stream_reader(f, closefd=False) as reader:
+                    with _gc_paused(content_size):
+                        return _load_pickle(reader)
+            except zstandard.ZstdError as e:
+                raise pickle.UnpicklingError(f"Corrupt compressed artifact: {e}") from e
+        if head != _ARROW_MAGIC:
+            with _gc_paused(os.fstat(f.fileno()).st_size):
+                return _load_pickle(f)
+    
+    return _read_feather(filepath)
+
+
+def _in_streamlit_runtime() -> bool:
+    """
+    Kiểm tra có đang chạy trong Streamlit server không, mà không import streamlit.
+    
+    Nếu chưa module nào import streamlit (vd. Django worker) thì chắc chắn không có runtime.
+    """
+    if 'streamlit' not in sys.modules:
+        return False
+    try:
+        from streamlit import runtime
+    except ImportError:
+        return False
+    return runtime.exists()
+
+
+def _is_dataframe(data: Any) -> bool:
+    """
+    Kiểm tra data có phải pandas DataFrame không mà không cần import pandas.
+    
+    Nếu pandas chưa được import thì data chắc chắn không phải DataFrame.
+    """
+    pd = sys.modules.get('pandas')
+    return pd is not None and isinstance(data, pd.DataFrame)
+
+
+def _is_ndarray(data: Any) -> bool:
+    """
+    Kiểm tra data có phải numpy ndarray không mà không cần import numpy.
+    """
+    np = sys.modules.get('numpy')
+    return np is not None and isinstance(data, np.ndarray)
+
+
+def _is_tensor(data: Any) -> bool:
+    """
+    Kiểm tra data có phải torch Tensor không mà không cần import torch.
+    """
+    torch = sys.modules.get('torch')
+    return torch is not None and isinstance(data, torch.Tensor)
+
+
+def _save_npy(data: Any, filepath: Path) -> Optional[str]:
+    """
+    Ghi mảng numpy dạng .npy (không pickle), đọc lại được bằng memory map.
+    """
+    import numpy as np
+    
+    # Lớp con (masked array, matrix) và mảng object vẫn cần pickle; np.memmap
+    # (mảng đọc lại từ .npy) được ghi như ndarray thường
+    if type(data) not in (np.ndarray, np.memmap) or data.dtype.hasobject:
+        return None
+    with open(filepath, 'wb') as f:
+        np.save(f, np.asarray(data), allow_pickle=False)
+    return NPY_SUFFIX
+
+
+def _save_torch(data: Any, filepath: Path) -> Optional[str]:
+    """
+    Ghi tensor bằng torch.save (định dạng zip).
+    """
+    import torch
+    
+    torch.save(data, filepath)
+    return TORCH_SUFFIX
+
+
+# Thứ tự ưu tiên: (kiểm tra kiểu, hàm ghi). Hàm ghi trả về đuôi file của định dạng
+# đã ghi, hoặc None nếu không xử lý được dữ liệu, khi đó dùng pickle protocol 5
+_WRITERS = (
+    (_is_dataframe, _dump_feather),
+    (_is_ndarray, _save_npy),
+    (_is_tensor, _save_torch),
+)
+
+
+def _write_artifact(data: Any, filepath: Path) -> str:
+    """
+    Ghi artifact bằng định dạng chuyên biệt theo kiểu dữ liệu, mặc định là pickle.
+    
+    Returns:
+        Đuôi file tương ứng với định dạng đã ghi
+    """
+    for matches, writer in _WRITERS:
+        if matches(data):
+            suffix = writer(data, filepath)
+            if suffix is not None:
+                return suffix
+            break
+    return _write_pickle_file(data, filepath)
+
+
+# Giá trị mặc định cho session_state.get(): phân biệt "không có key" với None
+_MISSING = object()
+
+
+def _is_valid_data(data: Any) -> bool:
+    """
+    Kiểm tra xem dữ liệu có hợp lệ không.
+    
+    Args:
+        data: Dữ liệu cần kiểm tra
+    
+    Returns:
+        True nếu dữ liệu hợp lệ
+    """
+    if data is None:
+        return False
+    if isinstance(data, dict):
+        return len(data) > 0
+    if isinstance(data, (list, tuple)):
+        return len(data) > 0
+    # DataFrame/Series: kiểm tra thuộc tính empty thay vì isinstance để không cần pandas
+    empty = getattr(data, 'empty', None)
+    if isinstance(empty, bool):
+        return not empty
+    # Các kiểu dữ liệu khác (int, float, str) đều hợp lệ nếu không None
+    return True
 
 
 class StepResultsManager:
@@ -66,11 +467,158 @@ class StepResultsManager:
         """
         self.artifacts_dir = Path(artifacts_dir)
         self.artifacts_dir.mkdir(parents=True, exist_ok=True)
+        
+        # Tính sẵn đường dẫn mọi biến thể định dạng của từng bước để không phải
+        # ghép Path mỗi lần gọi
+        self._variants: Dict[str, Dict[str, Path]] = {}
+        self._name_to_key: Dict[str, str] = {}
+        for key, filename in self.STEP_MAPPINGS.items():
+            stem = filename[:-len(LEGACY_SUFFIX)] if filename.endswith(LEGACY_SUFFIX) else filename
+            self._variants[key] = {
+                suffix: self.artifacts_dir / (stem + suffix) for suffix in _STEP_SUFFIXES
+            }
+            for path in self._variants[key].values():
+                self._name_to_key[path.name] = key
+        
+        # Bản đã giải mã của từng file kèm (mtime_ns, size) lúc đọc, chỉ dùng trong
+        # Streamlit runtime; mỗi file giữ đúng một bản, bị thay khi file đổi
+        self._memo: Dict[Path, Tuple[Tuple[int, int], Any]] = {}
+        
+        # (fingerprint, file, mtime_ns, size) của lần lưu gần nhất, dùng để bỏ qua việc
+        # ghi lại dữ liệu không đổi khi file đó vẫn là bản mới nhất của bước
+        self._last_hash: Dict[str, Tuple[int, Path, int, int]] = {}
+        
+        # File đọc lỗi, kèm (mtime_ns, size) lúc lỗi; bỏ qua cho tới khi file thay đổi
+        self._bad_files: Dict[Path, Tuple[int, int]] = {}
+        
+        # Ghi file chạy nền trên một worker để không chặn lượt rerun của Streamlit
+        # Mọi lượt ghi (kể cả save_step_result gọi trực tiếp) đều đi qua worker này,
+        # nên các lượt ghi cùng một bước luôn hoàn tất theo đúng thứ tự gọi
+        self._io_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="step-results-io")
+        self._pending: Dict[str, Future] = {}
+        self._pending_lock = threading.Lock()
+        atexit.register(self._io_pool.shutdown, wait=True)
+    
+    def _scan(self) -> Dict[str, os.DirEntry]:
+        """
+        Lấy các file artifact của các bước bằng một lần đọc thư mục.
+        
+        Returns:
+            Dictionary tên file -> DirEntry, rỗng nếu thư mục không tồn tại
+        """
+        try:
+            with os.scandir(self.artifacts_dir) as it:
+                return {
+                    entry.name: entry for entry in it
+                    if entry.name in self._name_to_key and entry.is_file()
+                }
+        except FileNotFoundError:
+            return {}
+    
+    def _present_keys(self, entries: Dict[str, os.DirEntry]) -> Set[str]:
+        """
+        Lấy các step_key có ít nhất một file trong kết quả của _scan.
+        
+        Returns:
+            Set step_key
+        """
+        return {self._name_to_key[name] for name in entries}
+    
+    @staticmethod
+    def _resolve(variants: Dict[str, Path], entries: Dict[str, os.DirEntry]) -> Optional[Tuple[Path, os.stat_result]]:
+        """
+        Tìm file mới nhất trong các biến thể định dạng của một bước.
+        
+        Chỉ stat các biến thể có trong kết quả của _scan (thường chỉ một file).
+        
+        Args:
+            variants: Các biến thể định dạng của bước (suffix -> đường dẫn)
+            entries: Kết quả của _scan
+            
+        Returns:
+            (đường dẫn, stat) của file mới nhất, hoặc None nếu bước chưa có file
+        """
+        newest = None
+        for path in variants.values():
+            entry = entries.get(path.name)
+            if entry is None:
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if newest is None or stat.st_mtime_ns > newest[1].st_mtime_ns:
+                newest = (path, stat)
+        return newest
+    
+    def step_key_for_filename(self, filename: str) -> Optional[str]:
+        """
+        Lấy step_key ứng với một tên file artifact (bất kỳ biến thể định dạng nào).
+        
+        Args:
+            filename: Tên file, ví dụ 'user_profiles.pkl'
+            
+        Returns:
+            step_key, hoặc None nếu file không thuộc bước nào
+        """
+        return self._name_to_key.get(filename)
+    
+    def get_step_file(self, step_key: str) -> Optional[Path]:
+        """
+        Lấy file hiện hành (mới nhất) của một bước.
+        
+        Args:
+            step_key: Key của bước
+            
+        Returns:
+            Đường dẫn file, hoặc None nếu chưa có
+        """
+        variants = self._variants.get(step_key)
+        if variants is None:
+            return None
+        self._wait_pending(step_key)
+        resolved = self._resolve(variants, self._scan())
+        return resolved[0] if resolved is not None else None
+    
+    def _wait_pending(self, step_key: str) -> None:
+        """
+        Chờ lượt ghi nền (nếu có) của một bước hoàn tất.
+        
+        Args:
+            step_key: Key của bước
+        """
+        with self._pending_lock:
+            future = self._pending.get(step_key)
+        if future is None:
+            return
+        future.result()
+        with self._pending_lock:
+            if self._pending.get(step_key) is future:
+                del self._pending[step_key]
+    
+    def _submit_write(self, step_key: str, data: Any) -> Future:
+        """
+        Xếp lượt ghi file của một bước vào worker ghi.
+        
+        Args:
+            step_key: Key của bước
+            data: Dữ liệu cần lưu
+            
+        Returns:
+            Future trả về kết quả của _write_step
+        """
+        with self._pending_lock:
+            future = self._io_pool.submit(self._write_step, step_key, data)
+            self._pending[step_key] = future
+        return future
     
     def save_step_result(self, step_key: str, data: Any) -> bool:
         """
         Lưu kết quả của một bước vào file.
         
+        Lượt ghi được xếp sau các lượt ghi nền đang chờ của cùng bước, nên bản ghi
+        cũ hơn không thể ghi đè lên bản này.
+        
         Args:
             step_key: Key của bước (ví dụ: 'pruned_interactions')
             data: Dữ liệu cần lưu
@@ -78,63 +626,144 @@ class StepResultsManager:
         Returns:
             True nếu lưu thành công, False nếu có lỗi
         """
-        if step_key not in self.STEP_MAPPINGS:
-            print(f"Warning: Unknown step key '{step_key}'")
+        if step_key not in self._variants:
+            logger.warning("Unknown step key '%s'", step_key)
             return False
         
-        filename = self.STEP_MAPPINGS[step_key]
-        filepath = self.artifacts_dir / filename
+        return self._submit_write(step_key, data).result()
+    
+    def _write_step(self, step_key: str, data: Any) -> bool:
+        """
+        Ghi file của một bước; chỉ chạy trên worker ghi (_io_pool).
+        
+        Args:
+            step_key: Key của bước
+            data: Dữ liệu cần lưu
+            
+        Returns:
+            True nếu lưu thành công, False nếu có lỗi
+        """
+        variants = self._variants[step_key]
         
+        fingerprint = self._fingerprint(data)
+        last = self._last_hash.get(step_key)
+        if fingerprint is not None and last is not None and last[0] == fingerprint:
+            resolved = self._resolve(variants, self._scan())
+            if resolved is not None and last[1:] == (resolved[0], resolved[1].st_mtime_ns, resolved[1].st_size):
+                return True
+        self._last_hash.pop(step_key, None)
+        
+        # Ghi ra file tạm rồi đổi tên, để người đọc không bao giờ thấy file ghi dở
+        tmp_path = self.artifacts_dir / f"{self.STEP_MAPPINGS[step_key]}.tmp.{os.getpid()}.{threading.get_ident()}"
         try:
-            with open(filepath, 'wb') as f:
-                pickle.dump(data, f)
-            return True
+            filepath = variants[_write_artifact(data, tmp_path)]
+            os.replace(tmp_path, filepath)
         except Exception as e:
-            print(f"Error saving {step_key}: {str(e)}")
+            try:
+                tmp_path.unlink(missing_ok=True)
+            except OSError:
+                pass
+            logger.warning("Error saving %s: %s", step_key, e)
             return False
+        
+        # Xóa các biến thể định dạng khác để không còn bản cũ của bước này
+        for other in variants.values():
+            self._memo.pop(other, None)
+            if other != filepath:
+                try:
+                    other.unlink(missing_ok=True)
+                except OSError as e:
+                    logger.warning("Error deleting old file for %s: %s", step_key, e)
+        
+        self._bad_files.pop(filepath, None)
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            stat = None
+        if fingerprint is not None and stat is not None:
+            self._last_hash[step_key] = (fingerprint, filepath, stat.st_mtime_ns, stat.st_size)
+        return True
     
     def load_step_result(self, step_key: str) -> Optional[Any]:
         """
         Tải kết quả của một bước từ file.
         
+        Trong Streamlit runtime, bản đã giải mã được giữ lại và trả về cho các lần gọi
+        sau (kể cả từ session khác) cho tới khi file thay đổi, nên không được sửa tại
+        chỗ đối tượng trả về; muốn thay đổi thì tạo object mới và lưu lại.
+        
         Args:
             step_key: Key của bước
             
         Returns:
             Dữ liệu đã lưu hoặc None nếu không tồn tại/có lỗi
         """
-        if step_key not in self.STEP_MAPPINGS:
+        variants = self._variants.get(step_key)
+        if variants is None:
             return None
         
-        filename = self.STEP_MAPPINGS[step_key]
-        filepath = self.artifacts_dir / filename
+        self._wait_pending(step_key)
         
-        if not filepath.exists():
+        resolved = self._resolve(variants, self._scan())
+        if resolved is None:
             return None
+        filepath, stat = resolved
+        
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if self._bad_files.get(filepath) == signature:
+            return None
+        
+        # .npy được memory-map nên đọc gần như không tốn gì, không cần giữ lại;
+        # ngoài Streamlit (Django...) đọc thẳng từ file để không giữ dữ liệu lâu dài
+        memoize = not (USE_MMAP and filepath.suffix == NPY_SUFFIX) and _in_streamlit_runtime()
+        if memoize:
+            cached = self._memo.get(filepath)
+            if cached is not None and cached[0] == signature:
+                return cached[1]
         
         try:
-            with open(filepath, 'rb') as f:
-                return pickle.load(f)
-        except Exception as e:
-            print(f"Error loading {step_key}: {str(e)}")
+            data = _read_artifact(filepath)
+        except _LOAD_ERRORS as e:
+            self._bad_files[filepath] = signature
+            logger.warning("Error loading %s: %s", step_key, e)
             return None
+        except ImportError as e:
+            # Thiếu thư viện giải mã (pyarrow, zstandard, torch): file không hỏng nên
+            # không đưa vào _bad_files, cài thư viện xong là đọc lại được
+            logger.warning("Error loading %s: %s", step_key, e)
+            return None
+        
+        if memoize:
+            self._memo[filepath] = (signature, data)
+        return data
     
     def save_to_session_and_file(self, step_key: str, data: Any) -> bool:
         """
         Lưu kết quả vào cả session_state và file.
         
+        File được ghi ở luồng nền; load_step_result sẽ chờ lượt ghi này trước khi đọc.
+        Luồng nền pickle chính object data, nên không được sửa data tại chỗ sau khi
+        gọi hàm này; muốn thay đổi kết quả thì tạo object mới và lưu lại.
+        
         Args:
             step_key: Key của bước
             data: Dữ liệu cần lưu
             
         Returns:
-            True nếu lưu thành công
+            True nếu đã lưu vào session_state và xếp lịch ghi file
         """
+        import streamlit as st
+        
         # Lưu vào session_state
         st.session_state[step_key] = data
         
-        # Lưu vào file
-        return self.save_step_result(step_key, data)
+        if step_key not in self.STEP_MAPPINGS:
+            logger.warning("Unknown step key '%s'", step_key)
+            return False
+        
+        # Lưu vào file (chạy nền)
+        self._submit_write(step_key, data)
+        return True
     
     def load_from_file_to_session(self, step_key: str, force: bool = False) -> bool:
         """
@@ -147,9 +776,13 @@ class StepResultsManager:
         Returns:
             True nếu tải thành công
         """
+        import streamlit as st
+        
         # Nếu đã có trong session_state và không force, bỏ qua
-        if not force and step_key in st.session_state and self._is_valid_data(st.session_state[step_key]):
-            return True
+        if not force:
+            value = st.session_state.get(step_key, _MISSING)
+            if value is not _MISSING and _is_valid_data(value):
+                return True
         
         # Tải từ file
         data = self.load_step_result(step_key)
@@ -169,10 +802,32 @@ class StepResultsManager:
         Returns:
             Dictionary với key là step_key và value là True/False (thành công/thất bại)
         """
+        import streamlit as st
+        
+        present_keys = self._present_keys(self._scan())
+        
         results = {}
-        for step_key in self.STEP_MAPPINGS.keys():
-            results[step_key] = self.load_from_file_to_session(step_key, force=force)
-        return results
+        to_load = []
+        for step_key in self._variants:
+            value = _MISSING if force else st.session_state.get(step_key, _MISSING)
+            if value is not _MISSING and _is_valid_data(value):
+                results[step_key] = True
+            elif step_key in present_keys:
+                to_load.append(step_key)
+            else:
+                results[step_key] = False
+        
+        if to_load:
+            # Đọc các file song song; gán vào session_state trên luồng chính
+            # vì session_state không thread-safe
+            with ThreadPoolExecutor(max_workers=min(RESTORE_WORKERS, len(to_load))) as executor:
+                loaded = dict(zip(to_load, executor.map(self.load_step_result, to_load)))
+            for step_key, data in loaded.items():
+                if data is not None:
+                    st.session_state[step_key] = data
+                results[step_key] = data is not None
+        
+        return {step_key: results[step_key] for step_key in self.STEP_MAPPINGS.keys()}
     
     def get_step_status(self) -> Dict[str, Dict[str, Any]]:
         """
@@ -181,13 +836,21 @@ class StepResultsManager:
         Returns:
             Dictionary với thông tin về trạng thái của từng bước
         """
+        import streamlit as st
+        
+        entries = self._scan()
+        present_keys = self._present_keys(entries)
         status = {}
-        for step_key in self.STEP_MAPPINGS.keys():
-            filepath = self.artifacts_dir / self.STEP_MAPPINGS[step_key]
+        for step_key, variants in self._variants.items():
+            resolved = self._resolve(variants, entries) if step_key in present_keys else None
+            stat = resolved[1] if resolved is not None else None
+            value = st.session_state.get(step_key, _MISSING)
             status[step_key] = {
-                'in_session': step_key in st.session_state and self._is_valid_data(st.session_state.get(step_key)),
-                'in_file': filepath.exists(),
-                'file_path': str(filepath) if filepath.exists() else None
+                'in_session': value is not _MISSING and _is_valid_data(value),
+                'in_file': resolved is not None,
+                'file_path': str(resolved[0]) if resolved is not None else None,
+                'size': stat.st_size if stat is not None else 0,
+                'mtime': stat.st_mtime if stat is not None else 0.0,
             }
         return status
     
@@ -203,6 +866,8 @@ class StepResultsManager:
         Returns:
             True nếu xóa thành công
         """
+        import streamlit as st
+        
         success = True
         
         if clear_session and step_key in st.session_state:
@@ -211,13 +876,16 @@ class StepResultsManager:
             except:
                 success = False
         
-        if clear_file and step_key in self.STEP_MAPPINGS:
-            filepath = self.artifacts_dir / self.STEP_MAPPINGS[step_key]
-            if filepath.exists():
+        variants = self._variants.get(step_key) if clear_file else None
+        if variants is not None:
+            self._wait_pending(step_key)
+            self._last_hash.pop(step_key, None)
+            for filepath in variants.values():
+                self._memo.pop(filepath, None)
                 try:
-                    filepath.unlink()
+                    filepath.unlink(missing_ok=True)
                 except Exception as e:
-                    print(f"Error deleting file for {step_key}: {str(e)}")
+                    logger.warning("Error deleting file for %s: %s", step_key, e)
                     success = False
         
         return success
@@ -233,32 +901,77 @@ class StepResultsManager:
         Returns:
             Dictionary với kết quả xóa từng bước
         """
-        results = {}
-        for step_key in self.STEP_MAPPINGS.keys():
-            results[step_key] = self.clear_step(step_key, clear_session, clear_files)
+        import streamlit as st
+        
+        results = {step_key: True for step_key in self.STEP_MAPPINGS.keys()}
+        
+        if clear_session:
+            for step_key in self.STEP_MAPPINGS.keys():
+                if step_key in st.session_state:
+                    try:
+                        del st.session_state[step_key]
+                    except Exception:
+                        results[step_key] = False
+        
+        if clear_files:
+            with self._pending_lock:
+                pending = list(self._pending)
+            for step_key in pending:
+                self._wait_pending(step_key)
+            self._last_hash.clear()
+            self._memo.clear()
+            
+            # Một lần duyệt thư mục thay vì exists() + unlink() cho từng bước
+            for name, entry in self._scan().items():
+                step_key = self._name_to_key[name]
+                try:
+                    os.unlink(entry.path)
+                except OSError as e:
+                    logger.warning("Error deleting file for %s: %s", step_key, e)
+                    results[step_key] = False
+        
         return results
     
     @staticmethod
-    def _is_valid_data(data: Any) -> bool:
+    def _fingerprint(data: Any) -> Optional[int]:
         """
-        Kiểm tra xem dữ liệu có hợp lệ không.
+        Tính fingerprint rẻ của dữ liệu để nhận biết lần lưu lại không thay đổi.
         
         Args:
-            data: Dữ liệu cần kiểm tra
+            data: Dữ liệu cần lưu
             
         Returns:
-            True nếu dữ liệu hợp lệ
+            Fingerprint, hoặc None nếu không tính được (khi đó luôn ghi file)
         """
-        if data is None:
-            return False
-        if isinstance(data, dict):
-            return len(data) > 0
-        if isinstance(data, (list, tuple)):
-            return len(data) > 0
-        if isinstance(data, pd.DataFrame):
-            return not data.empty
-        # Các kiểu dữ liệu khác (int, float, str) đều hợp lệ nếu không None
-        return True
+        if isinstance(data, (str, bytes, int, float, bool)):
+            return hash((type(data), data))
+        
+        digest = hashlib.blake2b(digest_size=8)
+        if _is_dataframe(data):
+            import pandas as pd
+            
+            # attrs có thể chứa bất kỳ object nào, không hash ổn định được
+            if data.attrs:
+                return None
+            try:
+                row_hashes = pd.util.hash_pandas_object(data, index=True).to_numpy()
+            except TypeError:
+                # Cột chứa giá trị không hash được (list, dict...)
+                return None
+            # Hash theo dòng chỉ phủ giá trị; tên/kiểu của index và cột được thêm riêng
+            digest.update(repr((
+                list(data.columns), list(data.columns.names), list(map(str, data.dtypes)),
+                list(data.index.names), str(data.index.dtype),
+            )).encode())
+            digest.update(row_hashes.tobytes())
+        elif _is_ndarray(data) and data.dtype != object:
+            import numpy as np
+            
+            digest.update(repr((data.dtype.str, data.shape)).encode())
+            digest.update(np.ascontiguousarray(data).data)
+        else:
+            return None
+        return int.from_bytes(digest.digest(), 'little')
     
     def get_missing_steps(self) -> List[str]:
         """
@@ -267,11 +980,14 @@ class StepResultsManager:
         Returns:
             List các step_key chưa có dữ liệu
         """
+        import streamlit as st
+        
+        present_keys = self._present_keys(self._scan())
         missing = []
-        for step_key in self.STEP_MAPPINGS.keys():
-            filepath = self.artifacts_dir / self.STEP_MAPPINGS[step_key]
-            in_session = step_key in st.session_state and self._is_valid_data(st.session_state.get(step_key))
-            in_file = filepath.exists()
+        for step_key in self._variants:
+            value = st.session_state.get(step_key, _MISSING)
+            in_session = value is not _MISSING and _is_valid_data(value)
+            in_file = step_key in present_keys
             
             if not in_session and not in_file:
                 missing.append(step_key)
@@ -285,11 +1001,14 @@ class StepResultsManager:
         Returns:
             List các step_key đã hoàn thành
         """
+        import streamlit as st
+        
+        present_keys = self._present_keys(self._scan())
         completed = []
-        for step_key in self.STEP_MAPPINGS.keys():
-            filepath = self.artifacts_dir / self.STEP_MAPPINGS[step_key]
-            in_session = step_key in st.session_state and self._is_valid_data(st.session_state.get(step_key))
-            in_file = filepath.exists()
+        for step_key in self._variants:
+            value = st.session_state.get(step_key, _MISSING)
+            in_session = value is not _MISSING and _is_valid_data(value)
+            in_file = step_key in present_keys
             
             if in_session or in_file:
                 completed.append(step_key)
@@ -297,25 +1016,27 @@ class StepResultsManager:
         return completed
 
 
-# Singleton instance
-_manager_instance: Optional[StepResultsManager] = None
+_managers: Dict[str, StepResultsManager] = {}
+_managers_lock = threading.Lock()
 
 
-def get_step_results_manager(artifacts_dir: Optional[Path] = None) -> StepResultsManager:
+def get_step_results_manager(artifacts_dir: Union[str, Path]) -> StepResultsManager:
     """
-    Lấy singleton instance của StepResultsManager.
+    Lấy instance dùng chung của StepResultsManager cho một thư mục artifacts.
+    
+    Khóa của registry là đường dẫn tuyệt đối (os.path.abspath, không gọi syscall),
+    nên 'artifacts', './artifacts' và Path tương ứng đều trả về cùng một instance.
     
     Args:
-        artifacts_dir: Thư mục artifacts (chỉ cần truyền lần đầu tiên)
+        artifacts_dir: Thư mục artifacts
         
     Returns:
         StepResultsManager instance
     """
-    global _manager_instance
-    
-    if _manager_instance is None:
-        if artifacts_dir is None:
-            raise ValueError("artifacts_dir must be provided for first initialization")
-        _manager_instance = StepResultsManager(artifacts_dir)
-    
-    return _manager_instance
+    key = os.path.abspath(artifacts_dir)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = StepResultsManager(Path(key))
+            _managers[key] = manager
+        return manager